@@ -1,27 +1,118 @@
 #!/usr/bin/env python3
 import argparse
-from typing import Union
-
+import asyncio
+import sys
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from heapq import nsmallest
+from itertools import islice
+from operator import attrgetter, itemgetter
+from typing import Iterator, List, Optional, Union
+
+import aiohttp
 import rnc
+from rnc import corpora_requests as creq
 
 CORPORA = Union[rnc.MainCorpus, rnc.ParallelCorpus]
+# count of workers requesting pages of one query
+WORKERS = 5
+# (func, lowered word, count, Corpus kwargs) to
+# the task formatting examples, see format_examples()
+CACHE: 'OrderedDict[tuple, asyncio.Future]' = OrderedDict()
+CACHE_SIZE = 128
 
 LEFT_RUS_BORDER, RIGHT_RUS_BORDER = ord('а'), ord('я')
 LEFT_ENG_BORDER, RIGHT_ENG_BORDER = ord('a'), ord('z')
+# language tags of letter symbols, see classify_lang()
+RU_TAG, EN_TAG, OTHER_TAG = '\x01', '\x02', '\x03'
 
 
-def get(word: str,
-        count: int,
-        corpus,
-        **kwargs) -> CORPORA:
+async def get_htmls_coro(url: str,
+                         start: int,
+                         stop: int,
+                         session: aiohttp.ClientSession,
+                         **kwargs) -> List[str]:
+    """
+    Coro running rnc workers getting HTML codes
+     of the pages with the given session.
+
+    The same as rnc.corpora_requests.get_htmls_coro, but
+    the session and its connections are not closed after.
+
+    :param url: str, URL to request.
+    :param start: int, index of the first page.
+    :param stop: int, index of the page after the last one.
+    :param session: ClientSession object to request with.
+    :param kwargs: any HTTP params.
+    :return: list of str, HTML codes of the pages in order.
+    """
+    q_results = asyncio.Queue()
+    q_args = asyncio.Queue()
+
+    for p_index in range(start, stop):
+        q_args.put_nowait((url, session, {**kwargs, 'p': p_index}))
+
+    tasks = [
+        asyncio.create_task(
+            creq.worker_fetching_html(
+                f"Worker-{worker_index + 1}: ", q_args, q_results)
+        )
+        for worker_index in range(WORKERS)
+    ]
+    await q_args.join()
+
+    for task in tasks:
+        task.cancel()
+    # workers leave with QueueEmpty, retrieve it
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = [
+        q_results.get_nowait()
+        for _ in range(q_results.qsize())
+    ]
+    results.sort(key=itemgetter(0))
+    return [
+        html for _, html in results
+    ]
+
+
+@contextmanager
+def shared_session(session: aiohttp.ClientSession) -> Iterator[None]:
+    """
+    Make rnc request all pages with the session
+     instead of creating a new one for every request.
+
+    Only async methods of Corpus might be called inside,
+     the sync ones run their own event loop.
+
+    :param session: ClientSession object to request with.
+    :return: None.
+    """
+    get_htmls = creq.get_htmls_coro
+    creq.get_htmls_coro = partial(get_htmls_coro, session=session)
+    try:
+        yield
+    finally:
+        creq.get_htmls_coro = get_htmls
+
+
+async def get_async(word: str,
+                    count: int,
+                    corpus,
+                    **kwargs) -> CORPORA:
     """
     Get examples from the Corpus.
 
     Request count // 10 pages with dpp = 5 and
-     random sort.
+     random sort. The pages are downloaded concurrently
+     inside the running event loop, then parsed.
 
     There are >= count of examples than requested.
 
+    If so many pages can't be requested, request the only one,
+     if it's not the same request as the failed one.
+
     :param word: str, word to find its usage.
     :param count: int, count of examples.
     :param corpus: obj, Corpus class from where get examples.
@@ -30,14 +121,21 @@ def get(word: str,
     :exception: all the same as Corpus.
     """
     pages = count // 10 or 1
-    corp = corpus(word, pages, dpp=5, sort='random', **kwargs)
-    corp.request_examples()
+    try:
+        corp = corpus(word, pages, dpp=5, sort='random', **kwargs)
+        await corp.request_examples_async()
+    except (ValueError, creq.LastPageDoesntExist):
+        # retrying the same request is useless
+        if pages == 1:
+            raise
+        corp = corpus(word, 1, dpp=5, sort='random', **kwargs)
+        await corp.request_examples_async()
     return corp
 
 
-def get_russian(word: str,
-                count: int,
-                **kwargs) -> rnc.MainCorpus:
+async def get_russian(word: str,
+                      count: int,
+                      **kwargs) -> rnc.MainCorpus:
     """
     Get examples from the MainCorpus.
 
@@ -47,13 +145,13 @@ def get_russian(word: str,
     :return: MainCorpus object with got examples.
     :exception: all the same as Corpus.
     """
-    return get(word, count, rnc.MainCorpus, **kwargs)
+    return await get_async(word, count, rnc.MainCorpus, **kwargs)
 
 
-def get_parallel(word: str,
-                 count: int,
-                 language: str = 'en',
-                 **kwargs) -> rnc.ParallelCorpus:
+async def get_parallel(word: str,
+                       count: int,
+                       language: str = 'en',
+                       **kwargs) -> rnc.ParallelCorpus:
     """
     Get examples from the ParallelCorpus.
 
@@ -64,107 +162,297 @@ def get_parallel(word: str,
     :return: ParalellCorpus object with got examples.
     :exception: all the same as Corpus.
     """
-    return get(word, count, rnc.ParallelCorpus,
-               mycorp=rnc.mycorp[language], **kwargs)
+    return await get_async(word, count, rnc.ParallelCorpus,
+                           mycorp=rnc.mycorp[language], **kwargs)
+
+
+def _format_main(ex: rnc.MainExample) -> str:
+    """
+    :return: str, text and source of the example to print.
+    """
+    return f"txt: {ex.txt}\nsrc: {ex.src}\n\n"
+
+
+def _format_parallel(ex: rnc.ParallelExample) -> str:
+    """
+    :return: str, texts in all languages and source of the example to print.
+    """
+    texts = ''.join(
+        f"{lang}: {text}\n"
+        for lang, text in ex.txt.items()
+    )
+    return f"{texts}src: {ex.src}\n\n"
+
+
+# type of the Corpus to the text to sort
+# its examples by and the func to format them
+FORMAT = {
+    rnc.MainCorpus: (attrgetter('txt'), _format_main),
+    rnc.ParallelCorpus: (attrgetter('ru'), _format_parallel),
+}
+
+
+async def _format_examples(word: str,
+                           func,
+                           count: int,
+                           **kwargs) -> str:
+    """
+    Get examples from the Corpus, sort them by length of
+    Russian text and format very count of examples.
 
+    :param word: str, word to find its usage.
+    :param func: coro func which gets examples from the Corpus.
+    :param count: int, count of examples.
+    :param kwargs: any kwargs for Corpus class.
+    :return: str, formatted examples to print.
+    """
+    corp = await func(word, count, **kwargs)
+
+    # all examples have the same type, choose how to work with them once
+    get_text, format_example = FORMAT.get(type(corp), (None, _format_main))
+
+    examples = corp.data
+    if get_text is not None:
+        # calculate the lengths once and select
+        # indexes of count shortest examples by them
+        lengths = list(map(len, map(get_text, examples)))
+        order = nsmallest(count, range(len(lengths)), key=lengths.__getitem__)
+        examples = list(map(examples.__getitem__, order))
 
-def get_examples(word: str,
-                 func,
-                 count: int,
-                 **kwargs) -> None:
+    return ''.join(map(format_example, islice(examples, max(count, 0))))
+
+
+async def format_examples(word: str,
+                          func,
+                          count: int,
+                          cache: bool = True,
+                          **kwargs) -> str:
+    """
+    Get examples from the Corpus, sort them by length of
+    Russian text and format very count of examples.
+
+    The task getting them is stored in CACHE, so the same
+     queries, even running concurrently, are requested once.
+     CACHE keeps CACHE_SIZE last used queries.
+
+    :param word: str, word to find its usage.
+    :param func: coro func which gets examples from the Corpus.
+    :param count: int, count of examples.
+    :param cache: bool, whether to use CACHE.
+    :param kwargs: any kwargs for Corpus class.
+    :return: str, formatted examples to print.
+    """
+    if not cache:
+        return await _format_examples(word, func, count, **kwargs)
+
+    key = (func, word.lower(), count, frozenset(kwargs.items()))
+    task = CACHE.get(key)
+    # the task might be cancelled by the end of previous event loop
+    if task is None or task.cancelled():
+        task = asyncio.ensure_future(
+            _format_examples(word, func, count, **kwargs))
+        CACHE[key] = task
+        if len(CACHE) > CACHE_SIZE:
+            CACHE.popitem(last=False)
+    else:
+        CACHE.move_to_end(key)
+
+    try:
+        # cancelling one caller mustn't cancel the shared task
+        return await asyncio.shield(task)
+    except Exception:
+        if CACHE.get(key) is task:
+            del CACHE[key]
+        raise
+
+
+async def get_examples(word: str,
+                       func,
+                       count: int,
+                       **kwargs) -> None:
     """
     Get examples from the Corpus, sort them by length of
     Russian text and print very count of examples.
 
     :param word: str, word to find its usage.
-    :param func: func which gets examples from the Corpus.
+    :param func: coro func which gets examples from the Corpus.
     :param count: int, count of examples.
     :param kwargs: any kwargs for Corpus class.
     :return: None.
     """
-    try:
-        corp = func(word, count, **kwargs)
-    except ValueError:
-        corp = func(word, 1, **kwargs)
-
-    if isinstance(corp, rnc.MainCorpus):
-        corp.sort_data(key=lambda example: len(example.txt))
-    elif isinstance(corp, rnc.ParallelCorpus):
-        corp.sort_data(key=lambda example: len(example.ru))
-
-    for ex in corp[:count]:
-        if isinstance(ex, rnc.ParallelExample):
-            for lang, text in ex.txt.items():
-                print(f"{lang}: {text}")
-        else:
-            print(f"txt: {ex.txt}")
-        print(f"src: {ex.src}", end='\n\n')
+    # print all examples with one write
+    out = await format_examples(word, func, count, **kwargs)
+    sys.stdout.write(out)
+    sys.stdout.flush()
 
 
-def min_letter_index(string: str) -> int:
+async def get_examples_per_word(words: List[str],
+                                corpus: Optional[str],
+                                count: int,
+                                **kwargs) -> List[str]:
     """
-    :param string: str to work with.
-    :return: min index of letter symbol in the string;
-     -1 if the string is empty, 2000 if there's no letter symbol.
+    Get examples of each word from the Corpus concurrently
+    and print them in the order of the words, each block
+    after the word header.
+
+    If examples of a word can't be got, report it to
+     stderr and print examples of the other words.
+
+    :param words: list of str, words to find their usage.
+    :param corpus: str or None, --corpus value.
+    :param count: int, count of examples of each word.
+    :param kwargs: any kwargs for Corpus class.
+    :return: list of str, words whose examples weren't got.
     """
-    if not string:
-        return -1
+    results = await asyncio.gather(*(
+        format_examples(word, choose_func(word, corpus), count, **kwargs)
+        for word in words
+    ), return_exceptions=True)
+
+    outs, failed = [], []
+    for word, result in zip(words, results):
+        if isinstance(result, creq.BaseRequestError):
+            print(f"Examples of '{word}' weren't got: "
+                  f"{result.__class__.__name__}", file=sys.stderr)
+            failed += [word]
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            outs += [f"{word}:\n{result}"]
 
-    return min(
-        ord(symbol.lower()) if symbol.isalpha() else 2_000
-        for symbol in string
-    )
+    sys.stdout.write(''.join(outs))
+    sys.stdout.flush()
+    return failed
 
 
-def max_letter_index(string: str) -> int:
+def _lang_tag(symbol: str) -> Optional[str]:
+    """
+    :param symbol: str, one symbol.
+    :return: language tag of the symbol; None if it's not a letter.
     """
+    if not symbol.isalpha():
+        return None
+
+    lowered = symbol.lower()
+    if len(lowered) != 1:
+        return OTHER_TAG
+
+    code = ord(lowered)
+    if LEFT_RUS_BORDER <= code <= RIGHT_RUS_BORDER:
+        return RU_TAG
+    if LEFT_ENG_BORDER <= code <= RIGHT_ENG_BORDER:
+        return EN_TAG
+    return OTHER_TAG
+
+
+# Latin and Cyrillic symbols to their language tags,
+# not letter symbols are removed by str.translate
+LANG_TABLE = {
+    code: _lang_tag(chr(code))
+    for code in range(0x500)
+}
+TAGS = {RU_TAG, EN_TAG, OTHER_TAG}
+
+
+def classify_lang(string: str) -> Optional[str]:
+    """
+    Define the language of the string in one str.translate call.
+
     :param string: str to work with.
-    :return: max index of letter symbol in the string;
-     -1 if the string is empty or there's no letter symbol.
+    :return: 'ru' if all letters are Russian, 'en' if all
+     letters are English; None if the string is mixed or
+     there's no letter symbol.
     """
-    if not string:
-        return -1
+    tags = set(string.translate(LANG_TABLE))
+    # the symbols out of the table are left as they are
+    tags = {
+        tag if tag in TAGS else _lang_tag(tag)
+        for tag in tags
+    }
+    tags.discard(None)
 
-    return max(
-        ord(symbol.lower()) if symbol.isalpha() else -1
-        for symbol in string
-    )
+    if tags == {RU_TAG}:
+        return 'ru'
+    if tags == {EN_TAG}:
+        return 'en'
+    return None
 
 
 def is_russian(string: str) -> bool:
     """
     :return: bool, whether the string is Russian.
     """
-    return min_letter_index(string) >= LEFT_RUS_BORDER and \
-            max_letter_index(string) <= RIGHT_RUS_BORDER
+    return classify_lang(string) == 'ru'
 
 
 def is_english(string: str) -> bool:
     """
     :return: bool, whether the string is English.
     """
-    return min_letter_index(string) >= LEFT_ENG_BORDER and \
-            max_letter_index(string) <= RIGHT_ENG_BORDER
+    return classify_lang(string) == 'en'
 
 
-FUNC = {
-    'main': get_russian,
-    'parallel': get_parallel
+def _hide(word: str) -> str:
+    """
+    :return: str, the word hidden with asterisks.
+    """
+    return '***'
+
+
+def _ubold(word: str) -> str:
+    """
+    :return: str, the word in upper case in <b> tag.
+    """
+    return f"<b>{word.upper()}</b>"
+
+
+# (--corpus value, language of the word) to the func,
+# English words are always searched in the ParallelCorpus
+DISPATCH = {
+    (None, 'ru'): get_russian,
+    (None, 'en'): get_parallel,
+    (None, None): get_russian,
+    ('main', 'ru'): get_russian,
+    ('main', 'en'): get_parallel,
+    ('main', None): get_russian,
+    ('parallel', 'ru'): get_parallel,
+    ('parallel', 'en'): get_parallel,
+    ('parallel', None): get_parallel,
 }
+
+
+def choose_func(word: str,
+                corpus: Optional[str]):
+    """
+    :param word: str, word to find its usage.
+    :param corpus: str or None, --corpus value.
+    :return: coro func which gets examples of the word.
+    """
+    return DISPATCH[corpus, classify_lang(word)]
+
+
 MARKER = {
     'upper': str.upper,
-    'hide': lambda word: '***',
-    'bold': lambda word: f"<b>{word}</b>",
-    'ubold': lambda word: f"<b>{word.upper()}</b>",
+    'hide': _hide,
+    'bold': "<b>{}</b>".format,
+    'ubold': _ubold,
 }
-
-
-def main() -> None:
+# choices of command args, tuples keep
+# the order in usage and error messages
+CORPUS_CHOICES = ('parallel', 'main')
+LANG_CHOICES = ('en', 'arm', 'bas', 'bel', 'bul', 'bur', 'sp', 'it', 'ch',
+                'lat', 'lit', 'ger', 'pol', 'ukr', 'fr', 'fin', 'cz', 'sw',
+                'es')
+LEVEL_CHOICES = ('notset', 'debug', 'info', 'warning', 'error', 'critical')
+MARKER_CHOICES = tuple(MARKER)
+
+
+@lru_cache(maxsize=1)
+def create_parser() -> argparse.ArgumentParser:
     """
-    Parse command args, turn off file handler of RNC logger,
-    get and print examples according to command line args.
+    Create parser of command args once per process.
 
-    :return: None.
+    :return: ArgumentParser object.
     """
     parser = argparse.ArgumentParser(
         description="Get examples of the word usage. "
@@ -181,7 +469,7 @@ def main() -> None:
         help="Corpus where search word's examples; If the word is "
              "Russian use main, if it's English – use parallel.",
         type=str,
-        choices=('parallel', 'main'),
+        choices=CORPUS_CHOICES,
         default=None,
         dest='corpus'
     )
@@ -190,9 +478,7 @@ def main() -> None:
         help="Choose the language of the examples; English by default.",
         type=str,
         default='en',
-        choices=('en', 'arm', 'bas', 'bel', 'bul', 'bur', 'sp', 'it', 'ch',
-                 'lat', 'lit', 'ger', 'pol', 'ukr', 'fr', 'fin', 'cz', 'sw',
-                 'es'),
+        choices=LANG_CHOICES,
         dest='lang'
     )
     parser.add_argument(
@@ -207,7 +493,7 @@ def main() -> None:
         help="Level of stream handler of RNC logger. Warning by default.",
         type=str,
         default='warning',
-        choices=('notset', 'debug', 'info', 'warning', 'error', 'critical'),
+        choices=LEVEL_CHOICES,
         dest="level"
     )
     parser.add_argument(
@@ -215,27 +501,72 @@ def main() -> None:
         help="Choose how to mark found wordforms; Upper by default.",
         type=str,
         default='upper',
-        choices=('upper', 'hide', 'bold', 'ubold'),
+        choices=MARKER_CHOICES,
         dest='marker',
         required=False
     )
+    parser.add_argument(
+        '--per-word',
+        help="Search each word separately and concurrently "
+             "instead of searching all words as one query.",
+        action='store_true',
+        dest='per_word'
+    )
+    parser.add_argument(
+        '--no-cache',
+        help="Request the same queries again instead of "
+             "reusing their examples.",
+        action='store_true',
+        dest='no_cache'
+    )
+    return parser
+
+
+async def async_main() -> int:
+    """
+    Parse command args, turn off file handler of RNC logger,
+    get and print examples according to command line args.
 
+    :return: int, exit code; 1 if examples of some words weren't got.
+    """
+    parser = create_parser()
     args = parser.parse_args()
 
     rnc.set_file_handler_level('CRITICAL')
     rnc.set_stream_handler_level(args.level.upper())
 
-    func = FUNC.get(args.corpus, None)
     marker = MARKER[args.marker]
-    word = ' '.join(args.word)
+    corpus, count, lang = args.corpus, args.count, args.lang
+    cache = not args.no_cache
+
+    connector = aiohttp.TCPConnector(limit=20, keepalive_timeout=30)
+    timeout = aiohttp.ClientTimeout(creq.WAIT)
+    async with aiohttp.ClientSession(
+            connector=connector, timeout=timeout) as session:
+        with shared_session(session):
+            if args.per_word:
+                failed = await get_examples_per_word(
+                    args.word, corpus, count, cache=cache,
+                    marker=marker, language=lang)
+                return int(bool(failed))
+
+            word = ' '.join(args.word)
+            func = choose_func(word, corpus)
 
-    if is_english(word):
-        func = FUNC['parallel']
-    func = func or FUNC['main']
+            await get_examples(
+                word, func, count, cache=cache,
+                marker=marker, language=lang)
+            return 0
 
-    get_examples(
-        ' '.join(args.word), func, args.count,
-        marker=marker, language=args.lang)
+
+def main() -> None:
+    """
+    Run the async entry point in a new event loop
+     and exit with its code.
+
+    :return: None.
+    """
+    sys.exit(asyncio.run(async_main()))
 
 
 if __name__ == "__main__":